@@ -4,13 +4,47 @@
 実行: .venv の python で python scripts/add_problem_text_to_frequency.py
 """
 
+import bisect
+import functools
+import mmap
 import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+# ホットループで繰り返し使う正規表現はモジュールレベルでコンパイルしておく
+_EXAM_ID_RE = re.compile(r"(\d{4})(本|再)試験")
+_Q_SPLIT_RE = re.compile(r"[・、]")
+_Q_NUM_RE = re.compile(r"問(\d+)")
+# 問題文・選択肢・正解の見出しを1回の走査でまとめて拾う
+_BLOCK_RE = re.compile(
+    r"#{3,4}\s*(?P<kind>問題文(?:[（(](?:全文|要旨)[）)])?|選択肢|正解)\s*\n+"
+    r"(?P<body>.+?)(?=\n#{2,4}\s|\n---|\Z)",
+    re.DOTALL,
+)
+_CHOICE_BODY_RE = re.compile(
+    r"(?:-\s*\*\*[a-e①②③④⑤⑥⑦⑧⑨⑩][.．、:：]?\*\*[^\n]*\n?)+"
+)
+_SYM_PREFIX_RE = re.compile(r"^\s*[a-e①②③④⑤⑥⑦⑧⑨⑩]\s*[\.．、:：\s]*")
+_PAREN_RE = re.compile(r"[（(]([^）)]*)[）)]")
+_WS_RE = re.compile(r"\s+")
+_CHARS_RE = re.compile(r"[一-龥]{2,}|[a-zA-Z]{2,}")
+_Q_HEADING_RE = re.compile(
+    r"^#{2,4}\s+(問\d+(?:[・、]問?\d+)*)\s*(?:[（(][^）)]*[）)])?\s*$", re.MULTILINE
+)
+_NEXT_Q_RE = re.compile(r"^#{2,4}\s+問\d", re.MULTILINE)
+_NEXT_H_RE = re.compile(r"^#{2,3}\s+", re.MULTILINE)
+
+# デコード前のバイト列プレフィルタ用リテラル
+_KAISETSU_BYTES = "問題解説".encode()
+
+# 前回実行分の問題文・選択肢ブロック除去用（行単位・1回の走査で両方消す）
+_CLEANUP_RE = re.compile(r"^- \*\*(?:問題文|選択肢)\*\* .*$\n?", re.MULTILINE)
+
 
 def exam_id_from_filename(name: str) -> str:
     """2022本試験 -> 2022本試, 2022再試験 -> 2022再試"""
-    m = re.match(r"(\d{4})(本|再)試験", name)
+    m = _EXAM_ID_RE.match(name)
     if m:
         return f"{m.group(1)}{m.group(2)}試"
     return ""
@@ -19,8 +53,8 @@ def exam_id_from_filename(name: str) -> str:
 def parse_question_numbers(heading: str) -> list[int]:
     """## 問1, ## 問36・問38, ## 問35・36・37 などから番号リストを抽出"""
     nums = []
-    for part in re.split(r"[・、]", heading):
-        m = re.search(r"問(\d+)", part)
+    for part in _Q_SPLIT_RE.split(heading):
+        m = _Q_NUM_RE.search(part)
         if m:
             nums.append(int(m.group(1)))
     return nums
@@ -33,56 +67,62 @@ def extract_problem_choices_answer(text: str, start: int, end: int) -> tuple[str
     choices_lines = []
     answer = ""
 
-    # 問題文: ### 問題文 または #### 問題文 の次
-    for pattern in [
-        r"#{3,4}\s*問題文[（(]全文[）)]\s*\n+(.+?)(?=\n#{2,4}\s|\n---|\Z)",
-        r"#{3,4}\s*問題文[（(]要旨[）)]\s*\n+(.+?)(?=\n#{2,4}\s|\n---|\Z)",
-        r"#{3,4}\s*問題文\s*\n+(.+?)(?=\n#{2,4}\s|\n---|\Z)",
-    ]:
-        prob_match = re.search(pattern, block, re.DOTALL)
-        if prob_match:
-            problem = prob_match.group(1).strip().replace("\n", " ")
-            break
-
-    # 選択肢: ### 選択肢 の次の - **a.** ... 形式（①②③④⑤なども対応）
-    choice_match = re.search(
-        r"#{3,4}\s*選択肢\s*\n+((?:-\s*\*\*[a-e①②③④⑤⑥⑦⑧⑨⑩][.．、:：]?\*\*[^\n]*\n?)+)",
-        block,
-    )
-    if choice_match:
-        raw = choice_match.group(1).strip()
-        for line in raw.split("\n"):
-            line = line.strip()
-            if line.startswith("- "):
-                choices_lines.append(line[2:].strip())
-
-    # 正解: ### 正解 の次の行（**d.** 手掌を内側に向ける 形式）
-    ans_match = re.search(
-        r"#{3,4}\s*正解\s*\n+(.+?)(?=\n#{2,4}\s|\n---|\Z)",
-        block,
-        re.DOTALL,
-    )
-    if ans_match:
-        raw = ans_match.group(1).strip().replace("**", "")
-        answer = re.sub(r"\s+", " ", raw.strip())
+    # 1回の走査で各見出しを拾い、種別ごとに最初の有効な出現を採用する
+    for m in _BLOCK_RE.finditer(block):
+        kind = m.group("kind")
+        body = m.group("body")
+        if kind.startswith("問題文"):
+            # 問題文: ### 問題文（全文/要旨） または #### 問題文 の次
+            if not problem:
+                problem = body.strip().replace("\n", " ")
+        elif kind == "選択肢":
+            # 選択肢: ### 選択肢 の次の - **a.** ... 形式（①②③④⑤なども対応）
+            if not choices_lines:
+                bm = _CHOICE_BODY_RE.match(body)
+                if bm:
+                    for line in bm.group(0).strip().split("\n"):
+                        line = line.strip()
+                        if line.startswith("- "):
+                            choices_lines.append(line[2:].strip())
+        elif not answer:
+            # 正解: ### 正解 の次の行（**d.** 手掌を内側に向ける 形式）
+            raw = body.strip().replace("**", "")
+            answer = _WS_RE.sub(" ", raw.strip())
 
     choices = " / ".join(choices_lines) if choices_lines else ""
     return problem, choices, answer
 
 
+@functools.lru_cache(maxsize=8192)
 def normalize_answer_for_match(s: str) -> str:
-    """正解文言の比較用に正規化（選択肢記号を除いたキーワード部分）"""
-    s = re.sub(r"^\s*[a-e①②③④⑤⑥⑦⑧⑨⑩]\s*[\.．、:：\s]*", "", s)
+    """正解文言の比較用に正規化（選択肢記号を除いたキーワード部分）
+
+    同じ行正解・候補正解が何度も比較されるため、結果をキャッシュする。
+    """
+    s = _SYM_PREFIX_RE.sub("", s)
     s = s.strip()
     # （xxx）や(xxx)の内容を抽出（④（左大脳半球の下前頭回）→ 左大脳半球の下前頭回）
-    s = re.sub(r"[（(]([^）)]*)[）)]", r"\1", s)
-    return re.sub(r"\s+", "", s)
+    s = _PAREN_RE.sub(r"\1", s)
+    return _WS_RE.sub("", s)
+
+
+def answer_char_set(norm: str) -> frozenset[str]:
+    """正規化済み正解から主要な文字列（漢字・英字2文字以上の連続）を抽出"""
+    return frozenset(_CHARS_RE.findall(norm))
+
 
+def answers_match(
+    row_norm: str,
+    row_chars: frozenset[str],
+    cand_norm: str,
+    cand_chars: frozenset[str],
+) -> bool:
+    """正解の意味的一致を判定（問番号がずれていても同一問題を検出）
 
-def answers_match(row_ans: str, cand_ans: str) -> bool:
-    """正解の意味的一致を判定（問番号がずれていても同一問題を検出）"""
-    r = normalize_answer_for_match(row_ans)
-    c = normalize_answer_for_match(cand_ans)
+    正規化済み文字列と answer_char_set 済みの集合を受け取る。
+    """
+    r = row_norm
+    c = cand_norm
     if not r or not c:
         return False
     if r == c:
@@ -94,62 +134,119 @@ def answers_match(row_ans: str, cand_ans: str) -> bool:
     if c in r:
         return len(c) >= 0.5 * len(r)
     # 主要な文字が含まれるか（手掌・内側など2文字以上）
-    r_chars = set(re.findall(r"[一-龥]{2,}|[a-zA-Z]{2,}", r))
-    c_chars = set(re.findall(r"[一-龥]{2,}|[a-zA-Z]{2,}", c))
-    return bool(r_chars & c_chars)
-
-
-def build_lookup(
-    root: Path,
-) -> tuple[
-    dict[tuple[str, int], list[tuple[str, str, str]]],
-    dict[str, list[tuple[int, str, str, str]]],
-]:
-    """(試験ID,問番号) および 試験ID->[(問番号,問題文,選択肢,正解),...] を構築"""
-    from collections import defaultdict
+    return bool(row_chars & cand_chars)
+
+
+def _parse_exam_file(
+    md_path: Path,
+) -> list[tuple[str, int, str, str, str, frozenset[str]]]:
+    """1ファイル分の (試験ID, 問番号, 問題文, 選択肢, 正規化正解, 文字集合) を抽出"""
+    exam_id = exam_id_from_filename(md_path.stem)
+    rows: list[tuple[str, int, str, str, str, frozenset[str]]] = []
+
+    # バイト列のままリテラル検索し、ヒットしたファイルだけデコードする
+    with md_path.open("rb") as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # 空ファイル
+            return rows
+        try:
+            if mm.find(_KAISETSU_BYTES) < 0:
+                return rows
+            text = mm[:].decode("utf-8")
+        finally:
+            mm.close()
+
+    # 問見出しを含まないファイルでは正規表現を走らせない
+    if "## 問" not in text and "### 問" not in text and "#### 問" not in text:
+        return rows
+
+    # 見出し位置を一度だけ列挙し、各ブロック終端は二分探索で求める
+    # （末尾検索を繰り返すと大きなファイルで O(N^2) になる）
+    q_heads = [h.start() for h in _NEXT_Q_RE.finditer(text)]
+    any_heads = [h.start() for h in _NEXT_H_RE.finditer(text)]
+
+    for m in _Q_HEADING_RE.finditer(text):
+        q_nums = parse_question_numbers(m.group(1))
+        if not q_nums:
+            continue
 
-    by_qnum: dict[tuple[str, int], list[tuple[str, str, str]]] = defaultdict(list)
-    by_exam: dict[str, list[tuple[int, str, str, str]]] = defaultdict(list)
-    exam_dir = root / "試験問題"
+        # 次の問題見出し（## 問N）または次の大見出しまでをブロックとする
+        i = bisect.bisect_right(q_heads, m.end())
+        if i < len(q_heads):
+            block_end = q_heads[i] - 1  # 見出し直前の改行位置
+        else:
+            j = bisect.bisect_right(any_heads, m.end())
+            block_end = any_heads[j] - 1 if j < len(any_heads) else len(text)
 
-    for md_path in sorted(exam_dir.rglob("*.md")):
-        if md_path.name in ("図を含む問題一覧.md", "README.md", "記号問題頻度順.md"):
-            continue
-        if "問題解説" not in md_path.name:
-            continue
+        problem, choices, answer = extract_problem_choices_answer(
+            text, m.end(), block_end
+        )
 
-        exam_id = exam_id_from_filename(md_path.stem)
-        if not exam_id:
+        if not (problem or choices):
             continue
 
-        text = md_path.read_text(encoding="utf-8")
+        norm_answer = normalize_answer_for_match(answer)
+        char_set = answer_char_set(norm_answer)
+        for qn in q_nums:
+            rows.append((exam_id, qn, problem, choices, norm_answer, char_set))
 
-        for m in re.finditer(
-            r"^#{2,4}\s+(問\d+(?:[・、]問?\d+)*)\s*(?:[（(][^）)]*[）)])?\s*$",
-            text,
-            re.MULTILINE,
-        ):
-            q_nums = parse_question_numbers(m.group(1))
-            if not q_nums:
-                continue
+    return rows
 
-            # 次の問題見出し（## 問N）または次の大見出しまでをブロックとする
-            next_m = re.search(r"\n^#{2,4}\s+問\d", text[m.end() :], re.MULTILINE)
-            if not next_m:
-                next_m = re.search(r"\n^#{2,3}\s+", text[m.end() :], re.MULTILINE)
-            block_end = m.end() + next_m.start() if next_m else len(text)
 
-            problem, choices, answer = extract_problem_choices_answer(
-                text, m.end(), block_end
-            )
+def build_lookup(
+    root: Path,
+) -> tuple[
+    dict[tuple[str, int], list[tuple[str, str, str, frozenset[str]]]],
+    dict[str, tuple[list[str], list[str], list[str], list[frozenset[str]]]],
+    dict[tuple[str, str], tuple[str, str]],
+]:
+    """(試験ID,問番号) および 試験ID->列指向の候補リスト を構築
+
+    by_qnum のエントリは (問題文, 選択肢, 正規化正解, 文字集合)。
+    by_exam は試験ごとの並列リスト (問題文列, 選択肢列, 正規化正解列,
+    文字集合列) で、全候補の線形走査をキャッシュ効率よく回すための形。
+    正解の正規化と文字集合の抽出は取り込み時に一度だけ行う。
+    (試験ID, 正規化正解) -> (問題文, 選択肢) の完全一致用インデックスも返す。
+    """
+    from collections import defaultdict
 
-            for qn in q_nums:
-                if problem or choices:
-                    entry = (problem, choices, answer)
-                    by_qnum[(exam_id, qn)].append(entry)
-                    by_exam[exam_id].append((qn, problem, choices, answer))
+    by_qnum: dict[
+        tuple[str, int], list[tuple[str, str, str, frozenset[str]]]
+    ] = defaultdict(list)
+    by_exam: dict[
+        str, tuple[list[str], list[str], list[str], list[frozenset[str]]]
+    ] = defaultdict(lambda: ([], [], [], []))
+    by_exam_key: dict[tuple[str, str], tuple[str, str]] = {}
+    exam_dir = root / "試験問題"
 
-    return dict(by_qnum), dict(by_exam)
+    paths = [
+        p
+        for p in sorted(exam_dir.rglob("*.md"))
+        if p.name not in ("図を含む問題一覧.md", "README.md", "記号問題頻度順.md")
+        and "問題解説" in p.name
+        and exam_id_from_filename(p.stem)
+    ]
+
+    # ファイル単位の抽出は独立なので並列化する。paths はソート済みで
+    # ex.map は入力順に結果を返すため、マージ順は逐次版と一致する
+    with ProcessPoolExecutor() as ex:
+        for rows in ex.map(_parse_exam_file, paths, chunksize=8):
+            for exam_id, qn, problem, choices, norm_answer, char_set in rows:
+                # pickle 経由で届いた試験IDを intern し、キーの実体を共有する
+                exam_id = sys.intern(exam_id)
+                by_qnum[(exam_id, qn)].append(
+                    (problem, choices, norm_answer, char_set)
+                )
+                problems, choices_col, norms, char_sets = by_exam[exam_id]
+                problems.append(problem)
+                choices_col.append(choices)
+                norms.append(norm_answer)
+                char_sets.append(char_set)
+                if norm_answer:
+                    by_exam_key.setdefault((exam_id, norm_answer), (problem, choices))
+
+    return dict(by_qnum), dict(by_exam), by_exam_key
 
 
 def format_problem_block(problem: str, choices: str) -> str:
@@ -171,10 +268,9 @@ def main():
 
     content = freq_path.read_text(encoding="utf-8")
     # 既存の誤追加ブロックを削除（前回実行分）
-    content = re.sub(r"\n- \*\*問題文\*\* [^\n]+", "", content)
-    content = re.sub(r"\n- \*\*選択肢\*\* [^\n]+", "", content)
+    content = _CLEANUP_RE.sub("", content)
 
-    by_qnum, by_exam = build_lookup(root)
+    by_qnum, by_exam, by_exam_key = build_lookup(root)
 
     def replace_row(m: re.Match) -> str:
         full_line = m.group(0)
@@ -182,7 +278,7 @@ def main():
         q_part = m.group(2).strip()
         row_ans = m.group(3).strip()
 
-        q_num_match = re.search(r"問(\d+)", q_part)
+        q_num_match = _Q_NUM_RE.search(q_part)
         if not q_num_match:
             return full_line
 
@@ -190,16 +286,26 @@ def main():
         candidates = by_qnum.get((exam, q_num), [])
         prob, choices = "", ""
 
-        for p, c, a in candidates:
-            if answers_match(row_ans, a):
+        # 行側の正規化・文字集合は行ごとに一度だけ計算する
+        rk = normalize_answer_for_match(row_ans)
+        row_chars = answer_char_set(rk)
+
+        for p, c, a, cs in candidates:
+            if answers_match(rk, row_chars, a, cs):
                 prob, choices = p, c
                 break
 
-        if not prob and exam in by_exam:
-            for _qn, p, c, a in by_exam[exam]:
-                if answers_match(row_ans, a):
-                    prob, choices = p, c
-                    break
+        if not prob:
+            # 正規化正解の完全一致を先に試す（O(1)）。外れた場合のみ線形走査
+            hit = by_exam_key.get((exam, rk)) if rk else None
+            if hit:
+                prob, choices = hit
+            elif exam in by_exam:
+                problems, choices_col, norms, char_sets = by_exam[exam]
+                for i, a in enumerate(norms):
+                    if answers_match(rk, row_chars, a, char_sets[i]):
+                        prob, choices = problems[i], choices_col[i]
+                        break
 
         block = format_problem_block(prob, choices)
         if block:
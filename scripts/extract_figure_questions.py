@@ -4,9 +4,15 @@
 実行: .venv の python で python scripts/extract_figure_questions.py
 """
 
+import bisect
+import io
+import mmap
 import re
 from pathlib import Path
 
+# デコード前のバイト列プレフィルタ用リテラル（全角・半角括弧の両対応）
+_FIG_BYTES = ("（図問題".encode(), "(図問題".encode())
+
 
 def main():
     root = Path(__file__).resolve().parent.parent
@@ -14,11 +20,16 @@ def main():
     out_path = root / "試験問題" / "図を含む問題一覧.md"
 
     # 図問題セクション: ## 問N（図問題） または ### 問N・問M（図問題
+    # （[・問\d]* は後続の括弧と曖昧でバックトラックを誘発するため構造を明示）
     fig_heading = re.compile(
-        r"^#{2,3}\s+(問\d+[・問\d]*)\s*[（(]図問題", re.MULTILINE
+        r"^#{2,3}\s+(問\d+(?:[・、]問?\d+)*)\s*[（(]図問題", re.MULTILINE
     )
     # 問題文内の図関連キーワード（要旨抽出用）
     fig_keywords = re.compile(r"図で選|図に示す|図示|模式図|図の番号|図の矢印|図の斜線")
+    # ブロック終端判定用の「## 」見出し
+    next_heading = re.compile(r"\n##\s+")
+    # 見出し記号・強調記号の除去用（translate は C レベルの一括処理）
+    markup_table = str.maketrans("", "", "#*")
 
     results = []  # (範囲, ファイル名, 問番号, 要旨)
 
@@ -27,34 +38,49 @@ def main():
             continue
         rel = md_path.relative_to(exam_dir)
         scope = rel.parts[0] if len(rel.parts) > 1 else "ルート"
-        text = md_path.read_text(encoding="utf-8")
+        # バイト列のままリテラル検索し、図問題を含むファイルだけデコードする
+        with md_path.open("rb") as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # 空ファイル
+                continue
+            try:
+                if all(mm.find(b) < 0 for b in _FIG_BYTES):
+                    continue
+                text = mm[:].decode("utf-8")
+            finally:
+                mm.close()
+
+        # 「## 」見出し位置を一度だけ列挙し、ブロック終端は二分探索で求める
+        heads = [h.start() for h in next_heading.finditer(text)]
 
         for m in fig_heading.finditer(text):
             qnum = m.group(1).strip()
             start = m.end()
             # 次の「## 」見出しまでをブロックとして取得（### は含める）
-            next_h = re.search(r"\n##\s+", text[start:])
-            end = start + next_h.start() if next_h else len(text)
+            i = bisect.bisect_left(heads, start)
+            end = heads[i] if i < len(heads) else len(text)
             block = text[start:end].strip()
             # 要旨：問題文らしい行を優先（図・選・どれか・示す を含む）、次に見出し以外
             lines = []
-            for line in block.split("\n"):
-                s = line.strip().replace("#", "").replace("**", "").strip()
+            total_len = -1  # " ".join(lines) の長さを逐次更新（毎回 join しない）
+            for line in block.splitlines():
+                s = line.translate(markup_table).strip()
                 if not s or len(s) < 3:
                     continue
+                # 記号のみの行（・ や - 単独）は len(s) < 3 で既に除外済み
                 if s in ("）", "---", "（", "）", "正解", "解説", "選択肢"):
                     continue
-                if re.match(r"^[・\-*]\s*$", s):
-                    continue
                 lines.append(s)
-                if len(" ".join(lines)) >= 180:
+                total_len += len(s) + 1
+                if total_len >= 180:
                     break
                 if len(lines) >= 6:
                     break
             summary = " ".join(lines[:6]).strip()
             if not summary:
-                for line in block.split("\n"):
-                    s = line.strip().replace("#", "").replace("**", "").strip()
+                for line in block.splitlines():
+                    s = line.translate(markup_table).strip()
                     if len(s) > 15 and ("図" in s or "選" in s or "示す" in s or "どれか" in s):
                         summary = s[:220] + ("..." if len(s) > 220 else "")
                         break
@@ -76,27 +102,26 @@ def main():
     for scope, fname, qnum, summary in unique:
         by_scope.setdefault(scope, []).append((fname, qnum, summary))
 
-    lines_out = [
-        "# 図を含む問題 一覧",
-        "",
-        "過去問から「（図問題）」として記載されている問題を抽出した一覧です。",
-        "実際の試験では図が配布されるため、本一覧では問題文・要旨のみ記載しています。",
-        "",
-        "---",
-        "",
-    ]
+    buf = io.StringIO()
+    buf.write(
+        "# 図を含む問題 一覧\n"
+        "\n"
+        "過去問から「（図問題）」として記載されている問題を抽出した一覧です。\n"
+        "実際の試験では図が配布されるため、本一覧では問題文・要旨のみ記載しています。\n"
+        "\n"
+        "---\n"
+        "\n"
+    )
     for scope in sorted(by_scope.keys()):
-        lines_out.append(f"## {scope}")
-        lines_out.append("")
+        buf.write(f"## {scope}\n\n")
         for fname, qnum, summary in sorted(by_scope[scope], key=lambda x: (x[0], x[1])):
-            lines_out.append(f"- **{qnum}**（{fname}）")
+            buf.write(f"- **{qnum}**（{fname}）\n")
             if summary:
-                lines_out.append(f"  {summary[:220]}{'...' if len(summary) > 220 else ''}")
-            lines_out.append("")
-        lines_out.append("---")
-        lines_out.append("")
+                buf.write(f"  {summary[:220]}{'...' if len(summary) > 220 else ''}\n")
+            buf.write("\n")
+        buf.write("---\n\n")
 
-    out_path.write_text("\n".join(lines_out), encoding="utf-8")
+    out_path.write_text(buf.getvalue().rstrip("\n") + "\n", encoding="utf-8")
     print(f"出力: {out_path}")
     print(f"図を含む問題: {len(unique)} 件")
 